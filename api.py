@@ -1,71 +1,545 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+import httpx
 import openai
+import tiktoken
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
+
+
+OPENAI_API_KEY = "your-openai-api-key"
+
+MODEL = "gpt-4o-mini"
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache.db")
+
+# Bounds on the number of tokens an article may use, scaled from the size of the user's input
+ARTICLE_MIN_TOKENS = 800
+ARTICLE_MAX_TOKENS = 4096
+ARTICLE_TOKENS_PER_INPUT_TOKEN = 4
+
+# Seconds to wait for a response before sending a duplicate request and keeping whichever answers first
+HEDGE_DELAY = 2.0
+
+# Static instructions sent ahead of every request, with the user input placed after them.
+# At roughly 450 tokens this prefix is below OpenAI's 1024-token minimum for prompt caching,
+# so it is not cached today; keeping it byte-identical and first means it would qualify if it grows.
+SYSTEM_PROMPT = """You are DevQuine, a technical writer who produces articles for the developer community.
+
+You will receive an article title, a list of tags, and free-form notes from the author.
+Your job is to turn them into a complete, publishable article.
+
+How to work:
+1. Before writing, silently plan a detailed outline for the article. Do not output the outline.
+2. Write the full article following that outline from start to finish.
+3. Output only the article itself, starting with its title.
+
+Outline rubric:
+- Open with an introduction that states the problem or topic and why a developer should care.
+- Follow with three to six body sections, each covering one idea in a logical order.
+- Every key point from the author's notes must appear in at least one section.
+- Use the tags to decide the technical depth, vocabulary, and ecosystem the article targets.
+- Where it helps understanding, plan a short code example, a command, or a concrete scenario.
+- Close with a conclusion that summarises the main takeaways and suggests a next step.
+
+Style guide:
+- Write in clear, plain English aimed at practising developers.
+- Prefer short paragraphs and active voice; explain jargon the first time it is used.
+- Use section headings for the body sections so the article is easy to scan.
+- Keep code examples minimal, correct, and directly related to the surrounding text.
+- Be accurate. When something depends on a version, platform, or configuration, say so.
+- Do not invent statistics, quotes, benchmarks, or references.
+- Do not address the reader as "dear reader" or pad the text with filler sentences.
+- Stay neutral when comparing tools, libraries, or vendors.
+
+Forbidden content:
+- Anything unrelated to the title, tags, and notes provided.
+- Promotional material, affiliate links, or calls to purchase products.
+- Personal data, credentials, API keys, or secrets, even as placeholders copied from the notes.
+- Instructions for malicious software, exploits against systems the reader does not own, or other harmful activity.
+- Offensive, discriminatory, or otherwise inappropriate language.
+
+If the notes are empty or very short, write a well-rounded introductory article on the title.
+If the notes contradict the title, follow the notes and adjust the framing of the article accordingly."""
+
+# A single client shared by every request. Its HTTP/2 connection pool keeps connections alive
+# between calls, so only the first request of a session pays for the TLS handshake.
+_client = openai.AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=60),
+    ),
+)
+
+# Approximate characters per token, used to count tokens until the encoding has loaded
+CHARS_PER_TOKEN = 4
+
+# Longest time, in seconds, that load_encoding(wait=True) blocks for the encoding
+ENCODING_LOAD_TIMEOUT = 10.0
+
+# The tokenizer is loaded by a background thread, since tiktoken may download it on first use
+_encoding = None
+_encoding_thread = None
+_encoding_lock = threading.Lock()
+
+
+class LLMCache:
+    """
+    A small on-disk cache of model responses backed by SQLite.
+
+    Responses are keyed on a SHA-256 of the model, prompt, and temperature, so
+    identical requests are answered from disk instead of calling the API again.
+    The prompt must be hashable, such as a string or a tuple of strings, so that
+    the keys of recent requests can be memoized. Expired entries are removed on
+    every write, and once the cache holds max_entries responses the oldest ones
+    are evicted. The database is only created when the cache is first used, and
+    a cache that cannot be read or written is treated as empty.
+
+    Attributes:
+    path (str): Location of the SQLite database file.
+    ttl (float): Number of seconds a cached response stays valid.
+    max_entries (int): Maximum number of responses kept on disk.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=7 * 24 * 60 * 60, max_entries=256):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._table_created = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        if not self._table_created:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache "
+                    "(key TEXT PRIMARY KEY, response TEXT, ts REAL)"
+                )
+            self._table_created = True
+        return conn
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _key(model, prompt, temperature):
+        payload = {"model": model, "prompt": prompt, "temperature": temperature}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def get(self, model, prompt, temperature):
+        """
+        Return the cached response for the request, or None if it is missing or expired.
+        """
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT response, ts FROM cache WHERE key = ?",
+                    (self._key(model, prompt, temperature),),
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return row[0]
+
+    def set(self, model, prompt, temperature, response):
+        """
+        Store the response for the request, replacing any previous entry, then drop
+        expired entries and evict the oldest ones beyond max_entries.
+        """
+        now = time.time()
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO cache (key, response, ts) VALUES (?, ?, ?)",
+                        (self._key(model, prompt, temperature), response, now),
+                    )
+                    conn.execute("DELETE FROM cache WHERE ts < ?", (now - self.ttl,))
+                    conn.execute(
+                        "DELETE FROM cache WHERE key NOT IN "
+                        "(SELECT key FROM cache ORDER BY ts DESC LIMIT ?)",
+                        (self.max_entries,),
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+
+
+cache = LLMCache()
+
+
+@retry(
+    stop=stop_after_attempt(4),
+    wait=wait_exponential_jitter(initial=1, max=10),
+    retry=retry_if_exception_type(
+        (
+            openai.RateLimitError,
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            openai.InternalServerError,
+        )
+    ),
+    reraise=True,
+)
+async def create_chat_completion(**kwargs):
+    """
+    Starts a chat completion, retrying transient failures and hedging slow requests.
 
+    If the request has not answered within HEDGE_DELAY seconds, an identical one is
+    sent and whichever succeeds first is used. The other request is cancelled, or
+    closed if it has already opened a stream, so the server stops generating for it.
+    With stream=True a request answers once the response headers arrive, so the
+    hedge covers slow connections and queueing but not a stall after the stream
+    has started. Rate limits, timeouts, connection errors, and server errors are
+    retried with exponential backoff.
 
-openai.api_key = "your-openai-api-key"
+    Parameters:
+    **kwargs: Arguments passed through to the chat completions endpoint.
 
+    Returns:
+    The chat completion, or a stream of chunks when stream=True is passed.
+    """
+    tasks = [asyncio.ensure_future(_client.chat.completions.create(**kwargs))]
+    winner = None
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=HEDGE_DELAY)
+        if not done:
+            tasks.append(asyncio.ensure_future(_client.chat.completions.create(**kwargs)))
 
-def generate_article_outline(title, notes, tags, temperature=0.7):
+        pending = set(tasks)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in done if task.exception() is None), None)
+
+        if winner is None:
+            # Every request failed; raise the original error so it can be retried
+            return tasks[0].result()
+        return winner.result()
+    finally:
+        for task in tasks:
+            if task is winner:
+                continue
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and task.exception() is None and kwargs.get("stream"):
+                # A losing request that already opened a stream must be closed explicitly
+                await task.result().close()
+
+
+@lru_cache(maxsize=256)
+def build_user_prompt(title, tags, notes):
     """
-    Generates a detailed outline for an article based on provided title, notes, and tags.
+    Builds the user message describing the requested article.
+
+    The result only depends on the arguments, so it is memoized and repeated
+    generations with unchanged inputs skip the string work.
 
     Parameters:
     title (str): The title of the article.
+    tags (str): Comma-separated tags relevant to the article.
     notes (str): Notes or key points to be included in the article.
+
+    Returns:
+    str: The user message.
+    """
+    # Convert comma-separated tags into a string with each tag properly stripped and separated
+    tag_string = ", ".join(tag.strip() for tag in tags.split(","))
+
+    return f"Title: {title}\nTags: {tag_string}\nNotes: {notes}"
+
+
+def build_messages(title, tags, notes):
+    """
+    Builds the chat messages asking the model for an article.
+
+    Parameters:
+    title (str): The title of the article.
     tags (str): Comma-separated tags relevant to the article.
-    temperature (float): Controls the creativity of the output. Default is 0.7.
+    notes (str): Notes or key points to be included in the article.
 
     Returns:
-    str: The generated outline of the article.
+    list[dict]: The system and user messages, static instructions first and user input last.
     """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_user_prompt(title, tags, notes)},
+    ]
+
+
+def _load_encoding():
+    global _encoding
     try:
-        # Convert comma-separated tags into a string with each tag properly stripped and separated
-        tag_string = ", ".join([tag.strip() for tag in tags.split(",")])
-
-        # Form the prompt to be sent to OpenAI's model
-        prompt = f"Title: {title}\nTags: {tag_string}\nNotes: {notes}\n\nCreate a detailed outline for an article based on the above information:"
-
-        # Call the OpenAI API to generate the outline
-        response = openai.Completion.create(
-            engine="text-davinci-003",
-            prompt=prompt,
-            max_tokens=200,  # Adjust max_tokens as needed for the outline
-            temperature=temperature,
-        )
+        _encoding = tiktoken.encoding_for_model(MODEL)
+    except Exception:
+        # Leave the encoding unset; token counts keep using the estimate
+        pass
+
+
+def load_encoding(wait=False):
+    """
+    Returns the model's tokenizer, starting to load it in the background if needed.
+
+    tiktoken may download the encoding on first use, which can take a long time or
+    hang, so it is never loaded on the calling thread. The load is only attempted
+    once per process.
+
+    Parameters:
+    wait (bool): Block for up to ENCODING_LOAD_TIMEOUT seconds for the encoding to
+        load. Default is False, which returns immediately.
+
+    Returns:
+    tiktoken.Encoding | None: The encoding, or None if it has not loaded (yet).
+    """
+    global _encoding_thread
+    with _encoding_lock:
+        if _encoding_thread is None:
+            _encoding_thread = threading.Thread(target=_load_encoding, daemon=True)
+            _encoding_thread.start()
+    if wait:
+        _encoding_thread.join(ENCODING_LOAD_TIMEOUT)
+    return _encoding
+
+
+def count_tokens(text):
+    """
+    Counts the tokens in the text with the model's encoding.
+
+    Falls back to an estimate based on CHARS_PER_TOKEN while the encoding is loading
+    or if it could not be loaded, so counting never blocks.
+
+    Parameters:
+    text (str): The text to count.
+
+    Returns:
+    int: The number of tokens.
+    """
+    encoding = load_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text))
+
+
+def article_max_tokens(messages):
+    """
+    Chooses the token budget for an article from the size of the user's input.
+
+    Short inputs are not charged for a large budget they never use, while long
+    notes get enough room for the article not to be cut off mid-sentence.
+
+    Parameters:
+    messages (list[dict]): The messages returned by build_messages.
+
+    Returns:
+    int: The max_tokens value to send with the request.
+    """
+    input_tokens = count_tokens(messages[-1]["content"])
+    return min(
+        ARTICLE_MAX_TOKENS,
+        max(ARTICLE_MIN_TOKENS, input_tokens * ARTICLE_TOKENS_PER_INPUT_TOKEN),
+    )
+
+
+async def generate_article(title, tags, notes, temperature=0.7):
+    """
+    Generates an article based on provided title, tags, and notes, streaming it as it is written.
+
+    The outline and the article are produced by a single chat completion, so the
+    first tokens reach the caller after one round-trip instead of two.
+
+    Parameters:
+    title (str): The title of the article.
+    tags (str): Comma-separated tags relevant to the article.
+    notes (str): Notes or key points to be included in the article.
+    temperature (float): Controls the creativity of the output. Default is 0.7.
+
+    Yields:
+    str: Successive pieces of the generated article.
+
+    Raises:
+    openai.OpenAIError: If the request still fails after retrying.
+    """
+    messages = build_messages(title, tags, notes)
+    # The cache key is built from strings only, so recent keys can be memoized
+    cache_prompt = tuple(message["content"] for message in messages)
+
+    # Deterministic requests are served from the on-disk cache when possible.
+    # Sampled output (temperature > 0) is expected to differ between calls, so it is never cached.
+    cacheable = temperature == 0
+    if cacheable:
+        cached = cache.get(MODEL, cache_prompt, temperature)
+        if cached is not None:
+            yield cached
+            return
 
-        # Return the text portion of the response, stripped of any leading/trailing whitespace
-        return response.choices[0].text.strip()
-    except Exception as e:
-        # Return the exception message in case of failure
-        return str(e)
+    # Call the OpenAI API and stream the article back as it is generated
+    response = await create_chat_completion(
+        model=MODEL,
+        messages=messages,
+        max_tokens=article_max_tokens(messages),
+        temperature=temperature,
+        stream=True,
+    )
 
+    article = ""
+    # Close the stream however iteration ends (cancellation, an error, or the consumer
+    # stopping early) so the server stops generating and the connection returns to the pool
+    async with response:
+        async for chunk in response:
+            # Each chunk carries the next piece of text; the final one has no content
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if content:
+                article += content
+                yield content
 
-def generate_full_article_from_outline(outline, temperature=0.7):
+    if cacheable:
+        cache.set(MODEL, cache_prompt, temperature, article)
+
+
+async def generate_articles(rows, temperature=0.7, max_concurrency=4):
     """
-    Generates a full article based on a given outline.
+    Generates several articles concurrently.
+
+    Requests overlap on the shared client instead of running one after another,
+    while a semaphore caps how many are in flight to stay within rate limits. A
+    failed row does not stop the others.
 
     Parameters:
-    outline (str): The outline of the article.
+    rows (list[dict]): Article inputs, each with "title", "tags", and "notes" keys.
     temperature (float): Controls the creativity of the output. Default is 0.7.
+    max_concurrency (int): Maximum number of requests in flight at once. Default is 4.
 
     Returns:
-    str: The generated full text of the article.
+    list[str | Exception]: The generated articles, in the same order as the rows, with
+        the exception raised for each row that could not be generated.
+
+    Raises:
+    ValueError: If max_concurrency is less than 1.
     """
-    try:
-        # Form the prompt to be sent to OpenAI's model using the provided outline
-        prompt = (
-            f"Write a detailed article based on the following outline:\n{outline}\n"
-        )
+    if max_concurrency < 1:
+        # A zero-sized semaphore would leave every row waiting forever
+        raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}")
 
-        # Call the OpenAI API to generate the full article
-        response = openai.Completion.create(
-            engine="text-davinci-003",
-            prompt=prompt,
-            max_tokens=800,  # Adjust max_tokens as needed for the full article
-            temperature=temperature,
-        )
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def generate_one(row):
+        async with semaphore:
+            return "".join(
+                [
+                    token
+                    async for token in generate_article(
+                        row["title"], row["tags"], row["notes"], temperature
+                    )
+                ]
+            )
+
+    return await asyncio.gather(
+        *(generate_one(row) for row in rows), return_exceptions=True
+    )
+
+
+async def submit_article_batch(rows, temperature=0.7):
+    """
+    Submits articles for generation through OpenAI's Batch API.
+
+    Batched requests are billed at half price and complete within 24 hours, which
+    suits bulk generation that does not need to be interactive.
+
+    Parameters:
+    rows (list[dict]): Article inputs, each with "title", "tags", and "notes" keys and
+        an optional "custom_id". Rows without one are identified by their index.
+    temperature (float): Controls the creativity of the output. Default is 0.7.
+
+    Returns:
+    str: The ID of the created batch.
+
+    Raises:
+    ValueError: If two rows end up with the same custom_id.
+    """
+    custom_ids = [str(row.get("custom_id", index)) for index, row in enumerate(rows)]
+    duplicates = sorted(
+        custom_id for custom_id, count in Counter(custom_ids).items() if count > 1
+    )
+    if duplicates:
+        # The Batch API rejects the whole file if any custom_id repeats
+        raise ValueError(f"Duplicate custom_id values in batch: {', '.join(duplicates)}")
+
+    lines = []
+    for custom_id, row in zip(custom_ids, rows):
+        messages = build_messages(row["title"], row["tags"], row["notes"])
+        request = {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": MODEL,
+                "messages": messages,
+                "max_tokens": article_max_tokens(messages),
+                "temperature": temperature,
+            },
+        }
+        lines.append(json.dumps(request))
+
+    batch_file = await _client.files.create(
+        file=("articles.jsonl", "\n".join(lines).encode()), purpose="batch"
+    )
+    batch = await _client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    return batch.id
+
+
+async def retrieve_article_batch(batch_id):
+    """
+    Retrieves the articles generated by a batch submitted with submit_article_batch.
+
+    Parameters:
+    batch_id (str): The ID returned by submit_article_batch.
+
+    Batches that expired or were cancelled still return the articles of the
+    requests that finished before they stopped, since those are already paid for.
+
+    Returns:
+    tuple[str, dict[str, str] | None]: The batch status, and the generated articles
+        keyed by custom_id, or None if the batch is still running or cancelling.
+        Requests that failed inside the batch are left out.
+
+    Raises:
+    RuntimeError: If the batch failed.
+    """
+    batch = await _client.batches.retrieve(batch_id)
+    if batch.status == "failed":
+        raise RuntimeError(f"Batch {batch_id} failed")
+    if batch.status not in ("completed", "expired", "cancelled"):
+        return batch.status, None
+
+    articles = {}
+    if batch.output_file_id is None:
+        return batch.status, articles
 
-        # Return the text portion of the response, stripped of any leading/trailing whitespace
-        return response.choices[0].text.strip()
-    except Exception as e:
-        # Return the exception message in case of failure
-        return str(e)
+    output = await _client.files.content(batch.output_file_id)
+    for line in output.text.splitlines():
+        result = json.loads(line)
+        response = result.get("response")
+        if result.get("error") or response is None or response["status_code"] != 200:
+            continue
+        articles[result["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    return batch.status, articles
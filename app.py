@@ -1,5 +1,9 @@
+import argparse
+import asyncio
+import json
 import sys
-import threading
+
+import qasync
 from PyQt5.QtWidgets import (
     QApplication,
     QWidget,
@@ -7,39 +11,54 @@ from PyQt5.QtWidgets import (
     QVBoxLayout,
     QLabel,
     QLineEdit,
+    QCheckBox,
     QTextEdit,
     QPushButton,
     QSplitter,
     QTextBrowser,
     QGroupBox,
     QScrollArea,
-    QGraphicsDropShadowEffect,
 )
-from PyQt5.QtGui import QFont, QFontDatabase, QColor
+from PyQt5.QtGui import QFont, QFontDatabase, QColor, QTextCursor
 from PyQt5.QtCore import QTimer, pyqtSignal
 
-from api import generate_article_outline, generate_full_article_from_outline
+from api import (
+    generate_article as stream_article,
+    generate_articles,
+    load_encoding,
+    retrieve_article_batch,
+    submit_article_batch,
+)
 
 
 class ArticleGenerator(QWidget):
 
     """
-    A PyQt5-based GUI application for generating articles using OpenAI's GPT model.
+    A PyQt5-based GUI application for generating articles using OpenAI's gpt-4o-mini model.
 
     This class creates an interface where users can input article titles, tags, and notes,
-    and receive a generated article based on these inputs. The class uses threading to
-    handle the API requests asynchronously, ensuring the GUI remains responsive.
+    and receive a generated article based on these inputs. The API requests run as
+    asyncio tasks on the Qt event loop, ensuring the GUI remains responsive.
 
     Attributes:
+    tokenReceived (pyqtSignal): Signal emitted for each piece of the article as it streams in.
     articleGenerated (pyqtSignal): Signal emitted when the article is generated.
     generated_text (str): String to hold the generated article text.
     ellipsis_timer (QTimer): Timer for the ellipsis animation during loading.
     ellipsis_count (int): Counter to keep track of the ellipsis animation state.
-    typing_timer (QTimer): Timer for simulating the typing effect of the article text.
+    generation_task (asyncio.Task): The task running the current API request, if any.
     """
 
+    tokenReceived = pyqtSignal(str)
     articleGenerated = pyqtSignal(str)
 
+    # Input fields shown on the left, as (label text, attribute name, widget class)
+    FIELDS = (
+        ("Article Title:", "title_entry", QLineEdit),
+        ("Tags (separated by commas):", "tags_entry", QLineEdit),
+        ("Article Notes:", "notes_entry", QTextEdit),
+    )
+
     def __init__(self):
         """
         Constructor for the ArticleGenerator class. Initializes the UI and timers.
@@ -47,19 +66,17 @@ class ArticleGenerator(QWidget):
         super().__init__()
         self.init_ui()  # Initialize the user interface components
         self.generated_text = ""  # Placeholder for the generated article text
+        self.generation_task = None  # Task running the current API request
 
         # Initialize a QTimer for creating an ellipsis animation during loading
         self.ellipsis_timer = QTimer()
         self.ellipsis_timer.timeout.connect(self.update_ellipsis)
         self.ellipsis_count = 0
 
-        # Connect the generated article signal to the GUI update function
+        # Connect the streaming and completion signals to the GUI update functions
+        self.tokenReceived.connect(self.append_generated_token)
         self.articleGenerated.connect(self.update_gui_with_generated_article)
 
-        # Initialize a QTimer for simulating the typing effect in the text display
-        self.typing_timer = QTimer()
-        self.typing_timer.timeout.connect(self.type_next_character)
-
     def init_ui(self):
         """
         Initialize the user interface components of the application.
@@ -88,25 +105,23 @@ class ArticleGenerator(QWidget):
         self.setLayout(main_layout)
 
     def setup_styles(self):
+        """
+        Set up the colors, font, and stylesheets shared by the widgets.
+
+        The stylesheets and the default font are built once here and reused by
+        every widget, instead of being recreated for each one.
+        """
+
         self.FONT_COLOR = QColor("#FFFFFF")
         self.INPUT_BOX_COLOR = QColor("#303030")
         self.BACKGROUND_COLOR = QColor("#1F1F1F")
         self.BUTTON_COLOR = QColor("#2196F3")
 
-        self.setStyleSheet(
-            f"background-color: {self.BACKGROUND_COLOR.name()}; color: {self.FONT_COLOR.name()}"
-        )
+        self._default_font = QFont("Arial", 16)
 
-    def create_shadow_effect(self):
-        shadow_effect = QGraphicsDropShadowEffect()
-        shadow_effect.setBlurRadius(150)
-        shadow_effect.setXOffset(5)
-        shadow_effect.setYOffset(5)
-        shadow_effect.setColor(QColor(0, 0, 0, 60))
-        return shadow_effect
+        self._label_qss = f"color: {self.FONT_COLOR.name()}"
 
-    def create_input_style(self):
-        return """
+        self._input_qss = """
         QLineEdit, QTextEdit {
             border: 1px solid #ccc;
             border-radius: 5px;
@@ -119,8 +134,7 @@ class ArticleGenerator(QWidget):
             self.FONT_COLOR.name(),
         )
 
-    def create_button_style(self):
-        return """
+        self._button_qss = """
         QPushButton {
             background-color: %s;
             color: %s;
@@ -135,59 +149,60 @@ class ArticleGenerator(QWidget):
             self.FONT_COLOR.name(),
         )
 
+        self._browser_qss = """
+        QTextBrowser {
+            border: none;
+            border-radius: 5px;
+            padding: 5px;
+            background-color: %s;
+            color: %s;
+        }
+        """ % (
+            self.INPUT_BOX_COLOR.name(),
+            self.FONT_COLOR.name(),
+        )
+
+        self.setStyleSheet(
+            f"background-color: {self.BACKGROUND_COLOR.name()}; color: {self.FONT_COLOR.name()}"
+        )
+
     def create_left_layout(self):
         """
         Create the left layout of the GUI.
 
         This layout includes input fields for the article title, tags, and notes,
-        as well as a button to trigger the article generation process. Each input
-        field and the button are styled and added to the layout.
+        as well as a button to trigger the article generation process. The input
+        fields are built from FIELDS and followed by a checkbox for deterministic,
+        cached output; each of them and the button are styled and added to the layout.
         """
 
         left_layout = QVBoxLayout()
         left_layout.setContentsMargins(10, 20, 10, 20)
         left_layout.setSpacing(20)
 
-        # Create and add the title label and entry
-        title_label = QLabel("Article Title:")
-        title_label.setFont(QFont("Arial", 16))
-        title_label.setStyleSheet(f"color: {self.FONT_COLOR.name()}")
-        left_layout.addWidget(title_label)
-
-        self.title_entry = QLineEdit()
-        self.title_entry.setFont(QFont("Arial", 16))
-        self.title_entry.setStyleSheet(self.create_input_style())
-        self.title_entry.setGraphicsEffect(self.create_shadow_effect())
-        left_layout.addWidget(self.title_entry)
-
-        # Create and add the tags label and entry
-        tags_label = QLabel("Tags (separated by commas):")
-        tags_label.setFont(QFont("Arial", 16))
-        tags_label.setStyleSheet(f"color: {self.FONT_COLOR.name()}")
-        left_layout.addWidget(tags_label)
-
-        self.tags_entry = QLineEdit()
-        self.tags_entry.setFont(QFont("Arial", 16))
-        self.tags_entry.setStyleSheet(self.create_input_style())
-        self.tags_entry.setGraphicsEffect(self.create_shadow_effect())
-        left_layout.addWidget(self.tags_entry)
-
-        # Create and add the notes label and entry
-        notes_label = QLabel("Article Notes:")
-        notes_label.setFont(QFont("Arial", 16))
-        notes_label.setStyleSheet(f"color: {self.FONT_COLOR.name()}")
-        left_layout.addWidget(notes_label)
-
-        self.notes_entry = QTextEdit()
-        self.notes_entry.setFont(QFont("Arial", 16))
-        self.notes_entry.setStyleSheet(self.create_input_style())
-        self.notes_entry.setGraphicsEffect(self.create_shadow_effect())
-        left_layout.addWidget(self.notes_entry)
+        # Create and add the label and entry for each input field
+        for label_text, attribute_name, widget_class in self.FIELDS:
+            label = QLabel(label_text)
+            label.setFont(self._default_font)
+            label.setStyleSheet(self._label_qss)
+            left_layout.addWidget(label)
+
+            entry = widget_class()
+            entry.setFont(self._default_font)
+            entry.setStyleSheet(self._input_qss)
+            setattr(self, attribute_name, entry)
+            left_layout.addWidget(entry)
+
+        # Create and add the option to reuse articles for repeated inputs
+        self.deterministic_checkbox = QCheckBox("Deterministic output (reuse cached articles)")
+        self.deterministic_checkbox.setFont(self._default_font)
+        self.deterministic_checkbox.setStyleSheet(self._label_qss)
+        left_layout.addWidget(self.deterministic_checkbox)
 
         # Create and add the generate button
         generate_button = QPushButton("Generate Article")
-        generate_button.setFont(QFont("Arial", 16))
-        generate_button.setStyleSheet(self.create_button_style())
+        generate_button.setFont(self._default_font)
+        generate_button.setStyleSheet(self._button_qss)
         generate_button.clicked.connect(self.generate_article)
         left_layout.addWidget(generate_button)
 
@@ -199,7 +214,8 @@ class ArticleGenerator(QWidget):
 
         This layout includes a text browser to display the generated article.
         It is placed inside a scroll area to handle articles that exceed the
-        display area. The layout also includes a label for the text browser.
+        display area. The layout also includes a label for the text browser and
+        a status label used while an article is being generated.
         """
 
         right_layout = QVBoxLayout()
@@ -208,25 +224,20 @@ class ArticleGenerator(QWidget):
         # Create and add the generated article label
         self.generated_title_label = QLabel("Generated Article")
         self.generated_title_label.setFont(QFont("Arial", 16, QFont.Bold))
-        self.generated_title_label.setStyleSheet(f"color: {self.FONT_COLOR.name()}")
+        self.generated_title_label.setStyleSheet(self._label_qss)
         right_layout.addWidget(self.generated_title_label)
 
+        # Create and add the label showing the generation status
+        self.status_label = QLabel("")
+        self.status_label.setFont(self._default_font)
+        self.status_label.setStyleSheet(self._label_qss)
+        right_layout.addWidget(self.status_label)
+
         # Create and add the text area for the generated article
         self.generated_text_area = QTextBrowser()
         self.generated_text_area.setReadOnly(True)
-        self.generated_text_area.setFont(QFont("Arial", 16))
-        self.generated_text_area.setStyleSheet(
-            """
-            QTextBrowser {
-                border: none;
-                border-radius: 5px;
-                padding: 5px;
-                background-color: %s;
-                color: %s;
-            }
-            """
-            % (self.INPUT_BOX_COLOR.name(), self.FONT_COLOR.name())
-        )
+        self.generated_text_area.setFont(self._default_font)
+        self.generated_text_area.setStyleSheet(self._browser_qss)
 
         scroll_area = QScrollArea()
         scroll_area.setWidgetResizable(True)
@@ -260,88 +271,109 @@ class ArticleGenerator(QWidget):
         Trigger the article generation process.
 
         This method is connected to the 'Generate Article' button. It retrieves
-        the text from input fields and starts a new thread to call the OpenAI API,
-        preventing the GUI from freezing during the API request.
+        the text from input fields and schedules a task on the event loop to call
+        the OpenAI API, preventing the GUI from freezing during the API request.
+        Any generation still in progress is cancelled first.
         """
 
         title = self.title_entry.text()
         tags = self.tags_entry.text()
         notes = self.notes_entry.toPlainText()
+        # Deterministic output uses temperature 0, which is the only setting served from the cache
+        temperature = 0 if self.deterministic_checkbox.isChecked() else 0.7
+        if self.generation_task is not None and not self.generation_task.done():
+            self.generation_task.cancel()
+
+        self.generated_text = ""
+        self.generated_text_area.clear()
+        self.ellipsis_count = 0
+        self.status_label.setText("Generating article")
         self.ellipsis_timer.start(500)
-        # Start a new thread for API call to avoid freezing the GUI
-        threading.Thread(
-            target=self.call_openai_api, args=(title, tags, notes), daemon=True
-        ).start()
+        # Schedule the API call on the event loop to avoid freezing the GUI
+        self.generation_task = asyncio.ensure_future(
+            self.call_openai_api(title, tags, notes, temperature)
+        )
 
-    def call_openai_api(self, title, tags, notes):
+    async def call_openai_api(self, title, tags, notes, temperature=0.7):
         """
         Call the OpenAI API to generate an article.
 
-        This method runs in a separate thread to avoid blocking the GUI.
-        It makes a request to the OpenAI API using the provided title, tags,
-        and notes, then emits a signal when the article is generated.
+        This coroutine runs on the event loop and awaits the network, so the GUI
+        keeps processing events while the article is generated.
+        It makes a streaming request to the OpenAI API using the provided title,
+        tags, and notes, emits a signal for each piece of text as it arrives,
+        and another once the article is complete.
 
         Parameters:
         title (str): The title of the article.
         tags (str): Tags associated with the article.
         notes (str): Additional notes or instructions for the article.
+        temperature (float): Controls the creativity of the output. Default is 0.7.
         """
 
         try:
-            outline = generate_article_outline(title, notes, tags)
-            generated_article = generate_full_article_from_outline(outline)
+            generated_article = ""
+            async for token in stream_article(title, tags, notes, temperature):
+                generated_article += token
+                self.tokenReceived.emit(token)
             self.articleGenerated.emit(generated_article)
         except Exception as e:
-            print(e)  # Handle error
+            # Report the failure instead of leaving the loading animation running
+            self.ellipsis_timer.stop()
+            self.status_label.setText(f"Failed to generate article: {e}")
 
-    def update_gui_with_generated_article(self, text):
+    def append_generated_token(self, token):
         """
-        Update the GUI with the generated article.
+        Append a freshly streamed piece of the article to the text area.
 
-        This method is called when the article generation is complete. It stops
-        the ellipsis timer, clears the text area, and starts the typing timer
-        to display the article with a typing effect.
+        The first token stops the ellipsis animation and clears the status
+        label, after which tokens are inserted as they arrive.
 
         Parameter:
-        text (str): The generated article text to display.
+        token (str): The next piece of the generated article.
         """
 
-        self.ellipsis_timer.stop()  # Stop the ellipsis timer
-        self.generated_text_area.clear()  # Clear the text area
+        if self.ellipsis_timer.isActive():
+            self.ellipsis_timer.stop()  # Stop the ellipsis timer
+            self.status_label.clear()  # Clear the loading text
 
-        self.full_generated_text = text
-        self.current_typing_position = 0
-        self.typing_timer.start(30)  # Start the typing effect
+        self.generated_text += token
+        # Always append at the end, even if the user clicked elsewhere in the text
+        self.generated_text_area.moveCursor(QTextCursor.End)
+        self.generated_text_area.insertPlainText(token)
 
-    def type_next_character(self):
+    def update_gui_with_generated_article(self, text):
         """
-        Simulate the typing effect by adding the next character to the text area.
+        Update the GUI with the generated article.
+
+        This method is called when the article generation is complete. The
+        article has already been streamed into the text area, so this only
+        makes sure the loading animation is stopped, the status label is cleared,
+        and the text is stored.
 
-        This method is connected to a timer that adds characters from the generated
-        article to the text display, creating a typing animation effect.
+        Parameter:
+        text (str): The generated article text to display.
         """
 
-        if self.current_typing_position < len(self.full_generated_text):
-            current_text = self.full_generated_text[self.current_typing_position]
-            self.generated_text_area.insertPlainText(
-                current_text
-            )  # Insert next character
-            self.current_typing_position += 1
-        else:
-            self.typing_timer.stop()
+        self.ellipsis_timer.stop()  # Stop the ellipsis timer
+        self.status_label.clear()
+
+        # Only rewrite the text area if it does not already hold the streamed article
+        if self.generated_text != text:
+            self.generated_text = text
+            self.generated_text_area.setPlainText(text)
 
     def update_ellipsis(self):
         """
         Update the ellipsis animation during the loading phase.
 
-        This method updates the text in the text area to include an ellipsis
-        that 'animates' by changing its length, indicating a loading process.
+        This method updates the status label to include an ellipsis that
+        'animates' by changing its length, indicating a loading process. The
+        article text area is left untouched so it never has to be rebuilt.
         """
 
         self.ellipsis_count = (self.ellipsis_count + 1) % 4
-        self.generated_text_area.setText(
-            "Generating article" + "." * self.ellipsis_count
-        )
+        self.status_label.setText("Generating article" + "." * self.ellipsis_count)
 
     def finish_loading(self):
         """
@@ -354,14 +386,155 @@ class ArticleGenerator(QWidget):
         self.update_gui_with_generated_article("Sample generated article text.")
 
 
+def read_rows(path):
+    """
+    Read article inputs from a JSONL file with one JSON object per line.
+
+    Parameters:
+    path (str): Path to the JSONL file.
+
+    Returns:
+    list[dict]: The rows, each with "title", "tags", and "notes" keys.
+    """
+
+    with open(path, encoding="utf-8") as rows_file:
+        return [json.loads(line) for line in rows_file if line.strip()]
+
+
+def positive_int(value):
+    """
+    Parse a command line value as an integer of at least 1.
+
+    Parameters:
+    value (str): The raw command line value.
+
+    Returns:
+    int: The parsed value.
+    """
+
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid integer: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def run_bulk_command(args):
+    """
+    Generate articles in bulk right away, without starting the GUI.
+
+    Reads one JSON object per line (with "title", "tags", and "notes" keys),
+    generates the articles concurrently, and prints one JSON object per row
+    with either the article or the error that prevented it.
+
+    Parameters:
+    args (argparse.Namespace): The parsed command line arguments.
+    """
+
+    rows = read_rows(args.rows_file)
+    load_encoding(wait=True)  # Size the token budgets with the real tokenizer if possible
+    results = asyncio.run(generate_articles(rows, max_concurrency=args.concurrency))
+    failed = False
+    for index, result in enumerate(results):
+        if isinstance(result, Exception):
+            failed = True
+            print(json.dumps({"index": index, "error": str(result)}))
+        else:
+            print(json.dumps({"index": index, "article": result}))
+    if failed:
+        sys.exit(1)
+
+
+def run_batch_command(args):
+    """
+    Run a bulk generation command through OpenAI's Batch API without starting the GUI.
+
+    'submit' reads one JSON object per line (with "title", "tags", and "notes" keys)
+    and prints the batch ID. 'fetch' prints one JSON object per generated article
+    once the batch has finished, warning when it expired or was cancelled and the
+    results are partial.
+
+    Parameters:
+    args (argparse.Namespace): The parsed command line arguments.
+    """
+
+    if args.batch_command == "submit":
+        rows = read_rows(args.rows_file)
+        load_encoding(wait=True)  # Size the token budgets with the real tokenizer if possible
+        print(asyncio.run(submit_article_batch(rows)))
+    else:
+        status, articles = asyncio.run(retrieve_article_batch(args.batch_id))
+        if articles is None:
+            print(f"Batch {args.batch_id} is still in progress ({status})", file=sys.stderr)
+            sys.exit(1)
+        if status != "completed":
+            print(
+                f"Batch {args.batch_id} {status} before finishing; "
+                "printing the articles that completed",
+                file=sys.stderr,
+            )
+        for custom_id, article in articles.items():
+            print(json.dumps({"custom_id": custom_id, "article": article}))
+
+
 def main():
     """
     Main function to create and run the PyQt application.
+
+    When invoked with the 'bulk' subcommand, articles are generated concurrently
+    and printed instead; with the 'batch' subcommand, they are generated in bulk
+    through OpenAI's Batch API.
     """
+    parser = argparse.ArgumentParser(description="DevQuine article generator")
+    subparsers = parser.add_subparsers(dest="command")
+
+    bulk_parser = subparsers.add_parser(
+        "bulk", help="generate articles in bulk right away, several at a time"
+    )
+    bulk_parser.add_argument(
+        "rows_file", help='JSONL file with "title", "tags" and "notes" on each line'
+    )
+    bulk_parser.add_argument(
+        "--concurrency", type=positive_int, default=4, help="maximum requests in flight at once"
+    )
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="generate articles in bulk with OpenAI's Batch API"
+    )
+    batch_subparsers = batch_parser.add_subparsers(dest="batch_command", required=True)
+    submit_parser = batch_subparsers.add_parser("submit", help="submit a batch of articles")
+    submit_parser.add_argument(
+        "rows_file", help='JSONL file with "title", "tags" and "notes" on each line'
+    )
+    fetch_parser = batch_subparsers.add_parser("fetch", help="print the articles of a batch")
+    fetch_parser.add_argument("batch_id", help="ID printed by 'batch submit'")
+
+    # Only parse the command line for a subcommand or help. Anything else, such as
+    # Qt's own options ("-style fusion"), is left for QApplication to handle.
+    if len(sys.argv) > 1 and sys.argv[1] in (*subparsers.choices, "-h", "--help"):
+        args = parser.parse_args()
+        if args.command == "bulk":
+            run_bulk_command(args)
+        else:
+            run_batch_command(args)
+        return
+
+    # Start loading the tokenizer in the background so the first request does not wait for it
+    load_encoding()
+
     app = QApplication(sys.argv)
+
+    # Run asyncio on top of the Qt event loop so API requests share it with the GUI
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+
     generator = ArticleGenerator()
     generator.show()
-    sys.exit(app.exec_())
+
+    with loop:
+        loop.run_forever()
 
 
 if __name__ == "__main__":